@@ -1,11 +1,14 @@
 import os
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from flask import Flask, render_template, request, redirect, url_for, flash
 from werkzeug.utils import secure_filename
-from astrospecvis.models.data_loader import load_nirspec_data, load_miri_spectra, extract_miri_data
+from astrospecvis.models.data_loader import load_nirspec_data_binned, load_miri_spectra, extract_miri_data
 from astrospecvis.models.data_processor import normalize_spectrum
 from astrospecvis.models.lightcurve_plotter import plot_enhanced_lightcurve_map, plot_specific_wavelength_lightcurves
+from astrospecvis.utils.utils import bin_flux_array, nanmedian_rows
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -28,6 +31,20 @@ app.secret_key = 'your_secret_key'  # Used for session management (change this i
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
+# Plot output directory, created once at startup so request handlers can
+# build paths without per-request existence checks
+PLOTS_DIR = os.path.join(app.static_folder, 'plots')
+os.makedirs(PLOTS_DIR, exist_ok=True)
+
+# On-disk cache of binned arrays, keyed by file hash and bin size
+CACHE_DIR = os.path.join(app.config['UPLOAD_FOLDER'], 'cache')
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+# Worker pool for the CPU-heavy load/bin/plot phase. NumPy and the Numba
+# kernels release the GIL there, so under a threaded WSGI server other
+# requests keep being served while a visualization is generated
+executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+
 # Function to check if the file has the correct extension
 def allowed_file(filename):
     """Check if the uploaded file has an allowed extension."""
@@ -66,6 +83,40 @@ def upload_file():
 
     return render_template('upload.html')
 
+# Cached data loading, keyed by (filename, mtime) so a re-upload under the
+# same name invalidates the entry while repeat visits reuse the arrays
+@lru_cache(maxsize=8)
+def load_visualization_data(filename, mtime, bin_size):
+    """Load and preprocess the binned data arrays for an uploaded FITS file.
+
+    Returns (binned_flux, binned_times, wavelengths), or None for
+    unsupported files. NIRSpec arrays additionally come from an on-disk
+    .npz cache, so the FITS decode and binning run once per upload.
+    """
+    # Determine whether the file is NIRSpec or MIRI based on the filename
+    lowered = filename.lower()
+    if 'nirspec' in lowered:
+        logger.info(f"Processing NIRSpec data for {filename}")
+        # Load NIRSpec data with the flux pre-binned and disk-cached
+        binned_flux, binned_times, wavelengths = load_nirspec_data_binned(
+            config['data_paths']['flux_nirspec_b'],
+            config['data_paths']['mjdarr'],
+            config['data_paths']['nirspec_wlarr'],
+            bin_size,
+            CACHE_DIR
+        )
+    elif 'miri' in lowered:
+        logger.info(f"Processing MIRI data for {filename}")
+        # Load and extract MIRI data
+        miri_table = load_miri_spectra(config['data_paths']['miri_spectra'])
+        times, wavelengths, _, spectra, _ = extract_miri_data(miri_table)
+        flux_data = normalize_spectrum(spectra)  # Normalize the spectrum for visualization
+        binned_flux = bin_flux_array(flux_data, bin_size)
+        binned_times = times[::bin_size]
+    else:
+        return None
+    return binned_flux, binned_times, wavelengths
+
 # Route for visualizing the uploaded FITS file
 @app.route('/visualize/<filename>')
 def visualize(filename):
@@ -74,49 +125,73 @@ def visualize(filename):
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         logger.info(f"Visualizing file: {filename}")
 
-        # Determine whether the file is NIRSpec or MIRI based on the filename
-        if 'nirspec' in filename.lower():
-            logger.info(f"Processing NIRSpec data for {filename}")
-            # Load NIRSpec data from the FITS file
-            flux_data, times, wavelengths = load_nirspec_data(
-                config['data_paths']['flux_nirspec_b'],
-                config['data_paths']['mjdarr'],
-                config['data_paths']['nirspec_wlarr']
-            )
-        elif 'miri' in filename.lower():
-            logger.info(f"Processing MIRI data for {filename}")
-            # Load and extract MIRI data
-            miri_table = load_miri_spectra(config['data_paths']['miri_spectra'])
-            times, wavelengths, _, spectra, _ = extract_miri_data(miri_table)
-            flux_data = normalize_spectrum(spectra)  # Normalize the spectrum for visualization
-        else:
-            flash('Unsupported file type')
-            return redirect(url_for('upload_file'))
-
-        # Generate various plots for visualization
-        variability_plot = plot_enhanced_lightcurve_map(
-            flux_data, wavelengths, times,
-            f"{filename} Variability Map",
-            bin_size=25,  # Add the bin size here
-            output_file=os.path.join(app.static_folder, 'plots', f'{filename}_variability.html'),
-            plot_type='variability'
-        )
+        # Plot output locations; inputs are immutable uploads, so plots newer
+        # than the upload can be served as-is without regeneration
+        variability_file = os.path.join(PLOTS_DIR, f'{filename}_variability.html')
+        flux_file = os.path.join(PLOTS_DIR, f'{filename}_flux.html')
+        lightcurves_file = os.path.join(PLOTS_DIR, f'{filename}_lightcurves.html')
 
-        flux_plot = plot_enhanced_lightcurve_map(
-            flux_data, wavelengths, times,
-            f"{filename} Flux Map",
-            bin_size=25,  # Specify bin size explicitly
-            output_file=os.path.join(app.static_folder, 'plots', f'{filename}_flux.html'),
-            plot_type='flux'  # Generate a flux map
+        source_mtime = os.path.getmtime(file_path) if os.path.exists(file_path) else 0.0
+        plots_fresh = all(
+            os.path.exists(plot_file) and os.path.getmtime(plot_file) > source_mtime
+            for plot_file in (variability_file, flux_file, lightcurves_file)
         )
 
-        specific_lightcurves = plot_specific_wavelength_lightcurves(
-            flux_data, wavelengths, times,
-            f"{filename} Specific Wavelength Light Curves",
-            output_file=os.path.join(app.static_folder, 'plots', f'{filename}_lightcurves.html')
-        )
+        def generate_plots():
+            """Load the data and write all three plots. Returns False for
+            unsupported files."""
+            # All three plots share one bin size; binning happens during
+            # loading so the cached entries are already binned
+            bin_size = 25
+            data = load_visualization_data(filename, source_mtime, bin_size)
+            if data is None:
+                return False
+            binned_flux, binned_times, wavelengths = data
+
+            # Per-wavelength medians, computed once and shared by the
+            # variability map and the band light curves
+            wl_median = nanmedian_rows(binned_flux)
+
+            # Generate various plots for visualization
+            plot_enhanced_lightcurve_map(
+                binned_flux, wavelengths, binned_times,
+                f"{filename} Variability Map",
+                bin_size=bin_size,
+                output_file=variability_file,
+                plot_type='variability',
+                skip_binning=True,
+                wl_median=wl_median
+            )
+
+            plot_enhanced_lightcurve_map(
+                binned_flux, wavelengths, binned_times,
+                f"{filename} Flux Map",
+                bin_size=bin_size,
+                output_file=flux_file,
+                plot_type='flux',  # Generate a flux map
+                skip_binning=True
+            )
 
-        logger.info(f"Plots generated successfully for {filename}")
+            plot_specific_wavelength_lightcurves(
+                binned_flux, wavelengths, binned_times,
+                f"{filename} Specific Wavelength Light Curves",
+                output_file=lightcurves_file,
+                skip_binning=True,
+                wl_median=wl_median
+            )
+            return True
+
+        if plots_fresh:
+            logger.info(f"Reusing cached plots for {filename}")
+        else:
+            # Run the heavy phase on a worker thread; its NumPy/Numba
+            # sections release the GIL, so the request thread pool stays
+            # responsive while this request computes
+            if not executor.submit(generate_plots).result():
+                flash('Unsupported file type')
+                return redirect(url_for('upload_file'))
+
+            logger.info(f"Plots generated successfully for {filename}")
 
         # Render the visualization page with generated plot files
         return render_template('visualize.html',
@@ -1,9 +1,17 @@
 # src/data_processing/data_loader.py
 
+import hashlib
+import logging
+import os
+
 from astropy.table import Table
 import astropy.io.fits as fits
 import numpy as np
 
+from astrospecvis.utils.utils import bin_flux_array
+
+logger = logging.getLogger(__name__)
+
 
 def load_miri_spectra(file_path: str) -> Table:
     """
@@ -40,7 +48,9 @@ def extract_miri_data(miri_table: Table) -> tuple:
     Returns:
         tuple: Contains modified_julian_dates, wavelengths_a, wavelengths_b, spectra_a, spectra_b
     """
-    print_miri_columns(miri_table)
+    # Debug-only: stdout prints serialize on write locks under gunicorn
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("MIRI data columns: %s", miri_table.colnames)
 
     # Extract data
     wavelengths_a = miri_table['wla']
@@ -49,18 +59,36 @@ def extract_miri_data(miri_table: Table) -> tuple:
     spectra_b = miri_table['fluxb']
     modified_julian_dates = miri_table['MJD']
 
-    # Get unique wavelengths and times
-    unique_wavelengths_a = np.unique(wavelengths_a)
-    unique_wavelengths_b = np.unique(wavelengths_b)
-    unique_times = np.unique(modified_julian_dates)
+    # Get unique wavelengths and times. MIRI tables are written sorted by
+    # MJD with the full wavelength grid repeating inside each block, so the
+    # unique values are just strided views; detect that layout and skip the
+    # three O(N log N) sorts that np.unique would run on the full columns
+    mjd_values = np.asarray(modified_julian_dates)
+    wla_values = np.asarray(wavelengths_a)
+    wlb_values = np.asarray(wavelengths_b)
+
+    n_wl = int(np.argmax(mjd_values != mjd_values[0]))
+    if (n_wl > 0 and len(mjd_values) % n_wl == 0
+            and np.all(np.diff(wla_values[:n_wl]) > 0)
+            and np.all(np.diff(wlb_values[:n_wl]) > 0)
+            and np.all(np.diff(mjd_values[::n_wl]) > 0)):
+        unique_wavelengths_a = wla_values[:n_wl]
+        unique_wavelengths_b = wlb_values[:n_wl]
+        unique_times = mjd_values[::n_wl]
+    else:
+        # Irregular layout; fall back to the sorting path
+        unique_wavelengths_a = np.unique(wla_values)
+        unique_wavelengths_b = np.unique(wlb_values)
+        unique_times = np.unique(mjd_values)
 
     # Reshape spectra into 2D arrays
     spectra_a_2d = spectra_a.reshape(len(unique_wavelengths_a), -1)
     spectra_b_2d = spectra_b.reshape(len(unique_wavelengths_b), -1)
 
-    print(f"Reshaped MIRI data: spectra_a_2d shape: {spectra_a_2d.shape}, spectra_b_2d shape: {spectra_b_2d.shape}")
-    print(f"Unique wavelengths A: {len(unique_wavelengths_a)}, B: {len(unique_wavelengths_b)}")
-    print(f"Unique times: {len(unique_times)}")
+    logger.debug("Reshaped MIRI data: spectra_a_2d shape: %s, spectra_b_2d shape: %s",
+                 spectra_a_2d.shape, spectra_b_2d.shape)
+    logger.debug("Unique wavelengths A: %d, B: %d", len(unique_wavelengths_a), len(unique_wavelengths_b))
+    logger.debug("Unique times: %d", len(unique_times))
 
     return unique_times, unique_wavelengths_a, unique_wavelengths_b, spectra_a_2d, spectra_b_2d
 
@@ -77,7 +105,52 @@ def load_nirspec_data(flux_file: str, mjd_file: str, wavelength_file: str) -> tu
     Returns:
         tuple: Contains flux_data, modified_julian_dates, and wavelengths numpy arrays.
     """
-    flux_data = fits.getdata(flux_file)
+    # Memory-map the (large) flux array so pages are read on demand by the
+    # OS instead of loading the whole file up front; the mapping stays valid
+    # after the HDUList is closed as long as the array is referenced.
+    with fits.open(flux_file, memmap=True, mode='readonly') as flux_hdul:
+        flux_data = flux_hdul[0].data
+    # The MJD and wavelength arrays are small; eager reads are fine
     modified_julian_dates = fits.getdata(mjd_file)
     wavelengths = fits.getdata(wavelength_file)
     return flux_data, modified_julian_dates, wavelengths
+
+
+def load_nirspec_data_binned(flux_file: str, mjd_file: str, wavelength_file: str,
+                             bin_size: int, cache_dir: str) -> tuple:
+    """
+    Load NIRSpec data with the flux pre-binned, backed by an on-disk cache.
+
+    The FITS decode and binning run once per (file, bin_size); the binned
+    arrays are saved as an .npz keyed by a partial hash of the flux file, so
+    subsequent calls skip the FITS parsing and binning entirely.
+
+    Args:
+        flux_file (str): Path to the flux data FITS file.
+        mjd_file (str): Path to the Modified Julian Date data FITS file.
+        wavelength_file (str): Path to the wavelength data FITS file.
+        bin_size (int): Number of timepoints to bin together.
+        cache_dir (str): Directory holding the cached .npz files.
+
+    Returns:
+        tuple: Contains binned_flux, binned_times, and wavelengths numpy arrays.
+    """
+    # A partial hash is enough to distinguish local uploads and avoids
+    # reading the whole file just to key the cache
+    with open(flux_file, 'rb') as raw_file:
+        file_hash = hashlib.md5(raw_file.read(1 << 16)).hexdigest()
+    cache_file = os.path.join(cache_dir, f'{file_hash}_{bin_size}.npz')
+
+    if os.path.exists(cache_file):
+        logger.info(f"Loading binned NIRSpec arrays from cache: {cache_file}")
+        with np.load(cache_file) as cached:
+            return cached['binned_flux'], cached['binned_times'], cached['wavelengths']
+
+    flux_data, modified_julian_dates, wavelengths = load_nirspec_data(flux_file, mjd_file, wavelength_file)
+    binned_flux = bin_flux_array(flux_data, bin_size)
+    binned_times = np.asarray(modified_julian_dates)[::bin_size]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(cache_file, binned_flux=binned_flux, binned_times=binned_times, wavelengths=wavelengths)
+    logger.info(f"Cached binned NIRSpec arrays at {cache_file}")
+    return binned_flux, binned_times, wavelengths
@@ -1,6 +1,70 @@
 # src/data_processing/data_processor.py
 
+import logging
+
 import numpy as np
+from numba import njit, prange
+
+logger = logging.getLogger(__name__)
+
+
+@njit(parallel=True, nogil=True)
+def variability_map(flux_data, out):
+    """
+    Compute the percent variability map in a single fused pass.
+
+    For each wavelength row, the median over finite values is computed on a
+    thread-local scratch buffer, then ((flux / median) - 1) * 100 is written
+    into `out` in the same loop, with NaN for non-finite inputs. This avoids
+    the separate np.nanmedian pass and the np.where temporaries.
+
+    Args:
+        flux_data (np.ndarray): 2D array of flux values (wavelengths x times).
+        out (np.ndarray): Preallocated output array of the same shape.
+    """
+    num_times = flux_data.shape[1]
+    for w in prange(flux_data.shape[0]):
+        scratch = np.empty(num_times, dtype=flux_data.dtype)
+        count = 0
+        for t in range(num_times):
+            value = flux_data[w, t]
+            if np.isfinite(value):
+                scratch[count] = value
+                count += 1
+        if count == 0:
+            for t in range(num_times):
+                out[w, t] = np.nan
+            continue
+        median = np.median(scratch[:count])
+        for t in range(num_times):
+            value = flux_data[w, t]
+            if np.isfinite(value):
+                out[w, t] = ((value / median) - 1) * 100
+            else:
+                out[w, t] = np.nan
+
+
+@njit(parallel=True, nogil=True)
+def _normalize_rows(spectral_data, out):
+    """
+    Normalize each row by its median over finite values in one fused pass.
+
+    The per-row median is computed on a thread-local scratch buffer and the
+    division written straight into `out`, avoiding np.nanmedian's separate
+    pass and the full-size quotient temporary.
+    """
+    num_cols = spectral_data.shape[1]
+    for w in prange(spectral_data.shape[0]):
+        scratch = np.empty(num_cols, dtype=spectral_data.dtype)
+        count = 0
+        for t in range(num_cols):
+            value = spectral_data[w, t]
+            if np.isfinite(value):
+                scratch[count] = value
+                count += 1
+        median = np.median(scratch[:count]) if count > 0 else np.nan
+        for t in range(num_cols):
+            out[w, t] = spectral_data[w, t] / median
 
 
 def normalize_spectrum(spectral_data: np.ndarray) -> np.ndarray:
@@ -13,18 +77,25 @@ def normalize_spectrum(spectral_data: np.ndarray) -> np.ndarray:
     Returns:
         np.ndarray: Normalized spectral array.
     """
-    print(f"Input spectral data shape: {spectral_data.shape}")
+    logger.debug("Input spectral data shape: %s", spectral_data.shape)
 
     if spectral_data.ndim == 1:
         # For 1D data, normalize by the median of the entire array
         median_spectrum = np.nanmedian(spectral_data)
         normalized_spectrum = spectral_data / median_spectrum
     elif spectral_data.ndim == 2:
-        # For 2D data, normalize each wavelength by its median across time
-        median_spectrum = np.nanmedian(spectral_data, axis=1, keepdims=True)
-        normalized_spectrum = spectral_data / median_spectrum
+        # For 2D data, normalize each wavelength by its median across time,
+        # fusing the median and division into a single Numba pass
+        spectral_data = np.ascontiguousarray(spectral_data)
+        if spectral_data.dtype.kind != 'f':
+            spectral_data = spectral_data.astype(np.float64)
+        elif not spectral_data.dtype.isnative:
+            # Table columns read from FITS arrive big-endian
+            spectral_data = spectral_data.astype(spectral_data.dtype.newbyteorder('='))
+        normalized_spectrum = np.empty_like(spectral_data)
+        _normalize_rows(spectral_data, normalized_spectrum)
     else:
         raise ValueError(f"Unexpected number of dimensions: {spectral_data.ndim}")
 
-    print(f"Output normalized spectrum shape: {normalized_spectrum.shape}")
+    logger.debug("Output normalized spectrum shape: %s", normalized_spectrum.shape)
     return normalized_spectrum
@@ -1,12 +1,22 @@
 import os
 import plotly.graph_objs as go
+import plotly.io as pio
 import numpy as np
 from astrospecvis.utils.utils import bin_flux_array
+from astrospecvis.models.data_processor import variability_map
 import logging
 import traceback
 
 logger = logging.getLogger(__name__)
 
+try:
+    # orjson encodes the large figure arrays several times faster than the
+    # stdlib json engine; fall back silently when it is not installed
+    import orjson  # noqa: F401
+    pio.json.config.default_engine = 'orjson'
+except ImportError:
+    pass
+
 
 def ensure_output_directory(file_path):
     """Ensure the output directory exists."""
@@ -18,7 +28,8 @@ def ensure_output_directory(file_path):
 
 def plot_enhanced_lightcurve_map(flux_data: np.ndarray, wavelengths: np.ndarray, times: np.ndarray,
                                  title: str, bin_size: int = 25, output_file: str = 'enhanced_lightcurve_map.html',
-                                 max_frames: int = 30, plot_type: str = 'variability'):
+                                 max_frames: int = 30, plot_type: str = 'variability',
+                                 skip_binning: bool = False, wl_median: np.ndarray = None):
     """
     Create an enhanced interactive 3D surface plot of a lightcurve map.
 
@@ -31,6 +42,10 @@ def plot_enhanced_lightcurve_map(flux_data: np.ndarray, wavelengths: np.ndarray,
         output_file (str): Name of the output HTML file.
         max_frames (int): Maximum number of frames for animation.
         plot_type (str): Type of plot to create ('variability' or 'flux').
+        skip_binning (bool): Set when flux_data and times are already binned,
+            so callers generating several plots can bin once and share.
+        wl_median (np.ndarray): Optional precomputed per-wavelength median of
+            the binned flux, shared across plots to avoid recomputation.
     """
     try:
         logger.info(f"Starting plot_enhanced_lightcurve_map for {title}")
@@ -44,9 +59,10 @@ def plot_enhanced_lightcurve_map(flux_data: np.ndarray, wavelengths: np.ndarray,
         # Convert bin_size to integer in case it is passed as a string
         bin_size = int(bin_size)
 
-        # Bin the data
-        flux_data = bin_flux_array(flux_data, bin_size)
-        times = times[::bin_size]  # Adjust times array to match binned data
+        # Bin the data unless the caller already did
+        if not skip_binning:
+            flux_data = bin_flux_array(flux_data, bin_size)
+            times = times[::bin_size]  # Adjust times array to match binned data
         logger.info(f"Flux data shape after binning: {flux_data.shape}")
 
         num_wavelengths, num_times = flux_data.shape
@@ -56,21 +72,27 @@ def plot_enhanced_lightcurve_map(flux_data: np.ndarray, wavelengths: np.ndarray,
             logger.error("No time points available after binning. Unable to create plot.")
             return
 
-        # Create mesh grid for plotting
+        # go.Surface accepts 1D x/y axes with a 2D z, so no meshgrid is needed
         time_hours = (times - times.min()) * 24  # Convert to hours
-        time_grid, wavelength_grid = np.meshgrid(time_hours, wavelengths)
-
-        # Ensure time_grid and wavelength_grid have the same shape as flux_data
-        time_grid = time_grid[:, :num_times]
-        wavelength_grid = wavelength_grid[:, :num_times]
+        time_hours = time_hours[:num_times]  # Match the binned time axis
 
-        logger.info(f"Time grid shape: {time_grid.shape}")
-        logger.info(f"Wavelength grid shape: {wavelength_grid.shape}")
+        logger.info(f"Time axis shape: {time_hours.shape}")
 
         if plot_type == 'variability':
-            # Calculate variability
-            median_flux = np.nanmedian(flux_data, axis=1, keepdims=True)
-            z_data = np.where(np.isfinite(flux_data), ((flux_data / median_flux) - 1) * 100, np.nan)
+            if wl_median is not None:
+                # Normalize against the shared precomputed medians. Dividing
+                # by values that may be NaN or zero blocks SIMD
+                # vectorization, so invert the medians once with a guard and
+                # use a multiply-subtract-multiply sequence instead
+                valid_median = np.isfinite(wl_median) & (wl_median != 0)
+                inv_median = np.divide(1.0, wl_median, out=np.full_like(wl_median, np.nan),
+                                       where=valid_median)
+                z_data = (flux_data * inv_median[:, np.newaxis] - 1.0) * 100.0
+                z_data = np.where(np.isfinite(z_data), z_data, np.nan)
+            else:
+                # Calculate variability in a single fused pass over the binned flux
+                z_data = np.empty_like(flux_data)
+                variability_map(flux_data, z_data)
             colorbar_title = 'Variability %'
         elif plot_type == 'flux':
             z_data = flux_data
@@ -81,29 +103,35 @@ def plot_enhanced_lightcurve_map(flux_data: np.ndarray, wavelengths: np.ndarray,
         logger.info(f"Z data shape before slicing: {z_data.shape}")
 
         # Slice the data to remove the first 60 wavelength points
-        wavelength_grid = wavelength_grid[60:, :]
-        time_grid = time_grid[60:, :]
         z_data = z_data[60:, :]
+        sliced_wavelengths = wavelengths[60:]
 
         logger.info(f"Z data shape after slicing: {z_data.shape}")
-        logger.info(f"Time grid shape after slicing: {time_grid.shape}")
-        logger.info(f"Wavelength grid shape after slicing: {wavelength_grid.shape}")
 
         # Check for valid data after slicing
         if not np.any(np.isfinite(z_data)):
             logger.error("No finite values in z_data after slicing. Unable to create plot.")
             return
 
+        # Display only needs float32 precision; halves RAM and HTML size
+        z_data = z_data.astype(np.float32, copy=False)
+        time_hours = time_hours.astype(np.float32, copy=False)
+        sliced_wavelengths = sliced_wavelengths.astype(np.float32, copy=False)
+
         # Define wavelength ranges for different compounds
         ch4_range = (2.14, 2.5)
         co_range = (4.5, 5.05)
 
-        # Create masks for each compound
-        ch4_mask = (wavelength_grid >= ch4_range[0]) & (wavelength_grid <= ch4_range[1])
-        co_mask = (wavelength_grid >= co_range[0]) & (wavelength_grid <= co_range[1])
+        # The wavelength axis must be monotonic for each band to be a
+        # contiguous row range; slicing by index then avoids full-grid
+        # boolean masks and np.where
+        assert np.all(np.diff(sliced_wavelengths) > 0), \
+            "wavelengths must be monotonically increasing"
+        ch4_lo, ch4_hi = np.searchsorted(sliced_wavelengths, ch4_range)
+        co_lo, co_hi = np.searchsorted(sliced_wavelengths, co_range)
 
-        logger.info(f"CH4 mask shape: {ch4_mask.shape}")
-        logger.info(f"CO mask shape: {co_mask.shape}")
+        logger.info(f"CH4 band rows: {ch4_lo}:{ch4_hi}")
+        logger.info(f"CO band rows: {co_lo}:{co_hi}")
 
         custom_colorscale = [
             [0, 'rgb(0, 0, 100)'],  # Dark blue for low values
@@ -113,7 +141,7 @@ def plot_enhanced_lightcurve_map(flux_data: np.ndarray, wavelengths: np.ndarray,
 
         # Create the surface plots
         surface_full = go.Surface(
-            x=time_grid, y=wavelength_grid, z=z_data,
+            x=time_hours, y=sliced_wavelengths, z=z_data,
             surfacecolor=z_data, colorscale=custom_colorscale,
             colorbar=dict(title=colorbar_title, titleside='right', titlefont=dict(size=14),
                           tickfont=dict(size=12), len=0.75, thickness=15),
@@ -121,32 +149,35 @@ def plot_enhanced_lightcurve_map(flux_data: np.ndarray, wavelengths: np.ndarray,
         )
 
         surface_ch4 = go.Surface(
-            x=time_grid, y=wavelength_grid, z=np.where(ch4_mask, z_data, np.nan),
-            surfacecolor=np.where(ch4_mask, z_data, np.nan), colorscale=custom_colorscale,
+            x=time_hours, y=sliced_wavelengths[ch4_lo:ch4_hi], z=z_data[ch4_lo:ch4_hi],
+            surfacecolor=z_data[ch4_lo:ch4_hi], colorscale=custom_colorscale,
             opacity=1, showscale=False, name='CH4 Band'
         )
 
         surface_co = go.Surface(
-            x=time_grid, y=wavelength_grid, z=np.where(co_mask, z_data, np.nan),
-            surfacecolor=np.where(co_mask, z_data, np.nan), colorscale=custom_colorscale,
+            x=time_hours, y=sliced_wavelengths[co_lo:co_hi], z=z_data[co_lo:co_hi],
+            surfacecolor=z_data[co_lo:co_hi], colorscale=custom_colorscale,
             opacity=1, showscale=False, name='CO Band'
         )
 
-        # Create frames for animation
+        # Create frames for animation. The frames differ only in the center
+        # of the Gaussian window, so all windows are computed in one
+        # (max_frames, num_times) broadcast instead of per-frame temporaries
         frames = []
-        frame_times = np.linspace(time_hours.min(), time_hours.max(), max_frames)
-        for i, time_point in enumerate(frame_times):
-            time_diff = np.abs(time_grid - time_point)
-            opacity = np.exp(-time_diff ** 2 / (2 * 5 ** 2))  # Gaussian window
-
-            frame = go.Frame(
-                data=[go.Surface(
-                    x=time_grid, y=wavelength_grid, z=z_data,
-                    surfacecolor=z_data * opacity, colorscale=custom_colorscale, opacity=1
-                )],
-                name=f'frame_{i}'
-            )
-            frames.append(frame)
+        frame_times = np.linspace(time_hours.min(), time_hours.max(), max_frames, dtype=np.float32)
+        opacity_all = np.exp(-(time_hours[np.newaxis, :] - frame_times[:, np.newaxis]) ** 2 / np.float32(2 * 5 ** 2))
+        for i in range(max_frames):
+            # Plain dicts skip the eager go.Frame/go.Surface validation;
+            # Plotly validates them lazily when the figure serializes
+            frames.append({
+                'data': [{
+                    'type': 'surface',
+                    'x': time_hours, 'y': sliced_wavelengths, 'z': z_data,
+                    'surfacecolor': z_data * opacity_all[i][np.newaxis, :],
+                    'colorscale': custom_colorscale, 'opacity': 1
+                }],
+                'name': f'frame_{i}'
+            })
 
         # Set up the layout
         layout = go.Layout(
@@ -194,9 +225,12 @@ def plot_enhanced_lightcurve_map(flux_data: np.ndarray, wavelengths: np.ndarray,
         # Ensure the output directory exists
         ensure_output_directory(output_file)
 
-        # Save the plot as an HTML file
+        # Save the plot as an HTML file. Referencing plotly.js from the CDN
+        # keeps the file a few KB instead of inlining the ~3 MB library,
+        # and lets the browser cache the library across all plots
         logger.info(f"Saving plot as HTML file: {output_file}")
-        fig.write_html(output_file)
+        with open(output_file, 'w') as html_file:
+            html_file.write(fig.to_html(include_plotlyjs='cdn', full_html=True, include_mathjax=False))
 
         logger.info(f"Enhanced plot creation complete for {title}")
     except Exception as e:
@@ -206,7 +240,8 @@ def plot_enhanced_lightcurve_map(flux_data: np.ndarray, wavelengths: np.ndarray,
 
 
 def plot_specific_wavelength_lightcurves(flux_data: np.ndarray, wavelengths: np.ndarray, times: np.ndarray,
-                                         title: str, output_file: str, bin_size: int = 25):
+                                         title: str, output_file: str, bin_size: int = 25,
+                                         skip_binning: bool = False, wl_median: np.ndarray = None):
     """
     Extract and plot light curves for specific wavelengths of interest, particularly CH4 and CO bands.
 
@@ -217,14 +252,20 @@ def plot_specific_wavelength_lightcurves(flux_data: np.ndarray, wavelengths: np.
         title (str): Title of the plot.
         output_file (str): Name of the output HTML file.
         bin_size (int): Size of bins for flux array.
+        skip_binning (bool): Set when flux_data and times are already binned,
+            so callers generating several plots can bin once and share.
+        wl_median (np.ndarray): Optional precomputed per-wavelength median of
+            the binned flux; when given, each row is normalized by its median
+            before averaging, replacing the per-lightcurve median pass.
     """
     try:
         logger.info(f"Starting plot_specific_wavelength_lightcurves for {title}")
 
-        # Bin the data
+        # Bin the data unless the caller already did
         bin_size = int(bin_size)  # Ensure bin_size is an integer
-        flux_data = bin_flux_array(flux_data, bin_size)
-        times = times[::bin_size]  # Adjust times array to match binned data
+        if not skip_binning:
+            flux_data = bin_flux_array(flux_data, bin_size)
+            times = times[::bin_size]  # Adjust times array to match binned data
 
         # Convert times to hours
         time_hours = (times - times.min()) * 24
@@ -233,17 +274,25 @@ def plot_specific_wavelength_lightcurves(flux_data: np.ndarray, wavelengths: np.
         ch4_range = (2.14, 2.5)
         co_range = (4.5, 5.05)
 
-        # Find indices for CH4 and CO bands
-        ch4_indices = np.where((wavelengths >= ch4_range[0]) & (wavelengths <= ch4_range[1]))[0]
-        co_indices = np.where((wavelengths >= co_range[0]) & (wavelengths <= co_range[1]))[0]
-
-        # Extract light curves
-        ch4_lightcurve = np.mean(flux_data[ch4_indices, :], axis=0)
-        co_lightcurve = np.mean(flux_data[co_indices, :], axis=0)
-
-        # Normalize light curves
-        ch4_lightcurve = ch4_lightcurve / np.median(ch4_lightcurve)
-        co_lightcurve = co_lightcurve / np.median(co_lightcurve)
+        # The wavelength axis must be monotonic for each band to be a
+        # contiguous row range; reducing over a slice view then avoids the
+        # row copies that fancy indexing with np.where would make
+        assert np.all(np.diff(wavelengths) > 0), \
+            "wavelengths must be monotonically increasing"
+        ch4_lo, ch4_hi = np.searchsorted(wavelengths, ch4_range)
+        co_lo, co_hi = np.searchsorted(wavelengths, co_range)
+
+        # Extract and normalize light curves
+        if wl_median is not None:
+            # Average rows already normalized by the shared per-wavelength
+            # medians; no further median pass is needed
+            ch4_lightcurve = np.mean(flux_data[ch4_lo:ch4_hi, :] / wl_median[ch4_lo:ch4_hi, np.newaxis], axis=0)
+            co_lightcurve = np.mean(flux_data[co_lo:co_hi, :] / wl_median[co_lo:co_hi, np.newaxis], axis=0)
+        else:
+            ch4_lightcurve = np.mean(flux_data[ch4_lo:ch4_hi, :], axis=0)
+            co_lightcurve = np.mean(flux_data[co_lo:co_hi, :], axis=0)
+            ch4_lightcurve = ch4_lightcurve / np.median(ch4_lightcurve)
+            co_lightcurve = co_lightcurve / np.median(co_lightcurve)
 
         # Create traces
         trace_ch4 = go.Scatter(x=time_hours, y=ch4_lightcurve, mode='lines', name='CH4 Band')
@@ -264,9 +313,10 @@ def plot_specific_wavelength_lightcurves(flux_data: np.ndarray, wavelengths: np.
         # Ensure the output directory exists
         ensure_output_directory(output_file)
 
-        # Save the plot as an HTML file
+        # Save the plot as an HTML file, referencing plotly.js from the CDN
         logger.info(f"Saving plot as HTML file: {output_file}")
-        fig.write_html(output_file)
+        with open(output_file, 'w') as html_file:
+            html_file.write(fig.to_html(include_plotlyjs='cdn', full_html=True, include_mathjax=False))
 
         logger.info(f"Specific wavelength light curves plot creation complete for {title}")
     except Exception as e:
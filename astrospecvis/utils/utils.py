@@ -1,6 +1,53 @@
 # src/utils/utils.py
 
 import numpy as np
+from numba import njit, prange
+
+try:
+    import bottleneck as bn
+except ImportError:  # bottleneck is optional; NumPy covers the fallback
+    bn = None
+
+
+def nanmedian_rows(flux_data: np.ndarray) -> np.ndarray:
+    """
+    Compute the NaN-aware median of each row of a 2D array.
+
+    Uses bottleneck's C implementation when available (2-3x faster than
+    np.nanmedian and releases the GIL), falling back to NumPy otherwise.
+
+    Args:
+        flux_data (np.ndarray): 2D array (wavelengths x times).
+
+    Returns:
+        np.ndarray: 1D array of per-row medians.
+    """
+    if bn is not None:
+        return bn.nanmedian(flux_data, axis=1)
+    return np.nanmedian(flux_data, axis=1)
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def _median_bin_2d(input_array, bin_size, out):
+    """
+    NaN-aware median binning kernel, parallelized over rows.
+
+    For each bin, finite values are gathered into a thread-local buffer of
+    length bin_size and the median is taken in place, avoiding the reshape
+    temporary that np.nanmedian over a reshaped view would allocate.
+    """
+    num_bins = out.shape[1]
+    for r in prange(input_array.shape[0]):
+        scratch = np.empty(bin_size, dtype=input_array.dtype)
+        for b in range(num_bins):
+            start = b * bin_size
+            count = 0
+            for k in range(bin_size):
+                value = input_array[r, start + k]
+                if not np.isnan(value):
+                    scratch[count] = value
+                    count += 1
+            out[r, b] = np.median(scratch[:count]) if count > 0 else np.nan
 
 
 def median_bin(input_array: np.ndarray, bin_size: int) -> np.ndarray:
@@ -14,11 +61,56 @@ def median_bin(input_array: np.ndarray, bin_size: int) -> np.ndarray:
     Returns:
         np.ndarray: Binned array.
     """
-    end_index = bin_size * (len(input_array) // bin_size)
-    return np.nanmedian(input_array[:end_index].reshape(-1, bin_size), axis=1)
+    return median_bin_2d(input_array.reshape(1, -1), bin_size)[0]
 
 
-import numpy as np
+def median_bin_2d(input_array: np.ndarray, bin_size: int) -> np.ndarray:
+    """
+    Perform median binning along the last axis of a 2D array, ignoring NaN values.
+
+    Args:
+        input_array (np.ndarray): Input 2D array to be binned row by row.
+        bin_size (int): Number of elements to bin together.
+
+    Returns:
+        np.ndarray: Binned 2D array.
+    """
+    bin_size = int(bin_size)
+    num_rows, num_cols = input_array.shape
+
+    if input_array.dtype.kind != 'f':
+        input_array = input_array.astype(np.float64)
+    elif not input_array.dtype.isnative:
+        # FITS data arrives big-endian; Numba only accepts native byte order
+        input_array = input_array.astype(input_array.dtype.newbyteorder('='))
+    binned = np.empty((num_rows, num_cols // bin_size), dtype=input_array.dtype)
+    _median_bin_2d(np.ascontiguousarray(input_array), bin_size, binned)
+
+    return binned
+
+
+# fastmath is restricted to flags that keep NaN comparisons intact,
+# since the kernel relies on `value == value` to skip NaNs.
+@njit(parallel=True, nogil=True, fastmath={'contract', 'reassoc', 'nsz', 'arcp'}, cache=True)
+def _bin_nanmean(flux_data, bin_size, out):
+    """
+    Fused NaN-aware mean binning kernel, parallelized over wavelengths.
+
+    Streams each wavelength row once, accumulating the sum and count of
+    finite values per bin, so no reshape temporary is allocated and the
+    NaN test fuses with the reduction.
+    """
+    for w in prange(flux_data.shape[0]):
+        for b in range(out.shape[1]):
+            start = b * bin_size
+            total = 0.0
+            count = 0
+            for k in range(bin_size):
+                value = flux_data[w, start + k]
+                if value == value:  # False only for NaN
+                    total += value
+                    count += 1
+            out[w, b] = total / count if count > 0 else np.nan
 
 
 def bin_flux_array(flux_data, bin_size):
@@ -38,12 +130,15 @@ def bin_flux_array(flux_data, bin_size):
     # Get the shape of the input data
     num_wavelengths, num_timepoints = flux_data.shape
 
-    # Check if num_timepoints and bin_size are compatible
-    if not isinstance(num_timepoints, int) or not isinstance(bin_size, int):
-        raise ValueError("num_timepoints and bin_size must be integers")
-
     binned_timepoints = num_timepoints // bin_size  # Integer division
-    binned_flux = np.nanmean(flux_data[:, :binned_timepoints * bin_size].reshape(
-        num_wavelengths, binned_timepoints, bin_size), axis=2)
+
+    # FITS data arrives big-endian; Numba only accepts native byte order
+    if not flux_data.dtype.isnative:
+        flux_data = flux_data.astype(flux_data.dtype.newbyteorder('='))
+
+    # Keep float inputs in their native precision; promote anything else
+    dtype = flux_data.dtype if flux_data.dtype.kind == 'f' else np.float64
+    binned_flux = np.empty((num_wavelengths, binned_timepoints), dtype=dtype)
+    _bin_nanmean(np.ascontiguousarray(flux_data), bin_size, binned_flux)
 
     return binned_flux